@@ -7,27 +7,27 @@
 #     create a publisher on PyPI...) and so on, in which case you WILL have a tag matching the TOML but you WILL NOT have anything on PyPI. Rerunning should detect this.
 #   - README links are broken. You should add an id=... attribute that handles spaces for h1, h2 and h3.
 
+# NOTE ON PERFORMANCE: Nothing in here is compute-bound. The time goes to starting 'git' subprocesses and, to a lesser
+#                      extent, imports and parsing the TOML. If this ever needs to be faster, reduce the number of Git calls
+#                      (or the amount of output they produce) rather than optimising the Python around them.
+
 def _main():
     import argparse
     import os
     import re
     import sys
-    import shutil
-    import tomllib
-    import subprocess
     from pathlib import Path
     from typing import Optional
-    from dataclasses import dataclass
 
     print()  # Newline
 
     # Define arguments. They are only parsed after we print the current version.
-    @dataclass
-    class Args:
+    class Args:  # Only a type hint for the parsed namespace, so no @dataclass (importing dataclasses pulls in inspect, which is slow).
         version: str
         no_v: bool
         no_zeroes: bool
         backfill: bool
+        check_retro: bool
         runtime_variable_path: Optional[Path]
         runtime_variable_name: Optional[str]
 
@@ -36,17 +36,23 @@ def _main():
     parser.add_argument("--no_v", action="store_true", help="If this flag is given, numeric versions will not automatically be prefixed with 'v'.")
     parser.add_argument("--no_zeroes", action="store_true", help="If this flag is given, zeroes on the left of numbers in numeric versions will be stripped.")
     parser.add_argument("--backfill", action="store_true", help="If this flag is given, the tool will find the latest release, and then look into its past for commits that bumped the TOML's version, to tag them with version tags retroactively, as if the version bump had been done with ReleaseMe. PyPI will still order these retroactive versions correctly, despite showing today's date as the publishing date.")
+    parser.add_argument("--check_retro", action="store_true", help="If this flag is given, a normal release will first search the full history for TOML version bumps since the latest release that were never released themselves, and offer to release them separately. Without this flag, that search only happens when the latest release cannot be identified from the most recent tag.")
     parser.add_argument("--runtime_variable_path", type=Path, help="Path to the file where the version is defined in a variable.")
     parser.add_argument("--runtime_variable_name", type=str, help="Name of the variable whose value should be set to the current version.", default="__version__")
     args: Args = parser.parse_args()  # You could do this later, but then --help is delayed until after some prints. We run as much as we can without arguments and then abort if the arguments are wrong.
 
     # Define version formatting based on args.
+    PATTERN_NUMERIC_VERSION = re.compile(r"^v?[0-9]+(\.[0-9]+)*$")  # Compiled once since it is matched for every version comparison.
+
     class Version:
         def __init__(self, raw: str):
             self._raw = raw.strip()
+            # Versions are immutable and compared over and over again when looking for releases, so parse them once.
+            self._numeric = PATTERN_NUMERIC_VERSION.match(self._raw) is not None
+            self._numeric_tuple = tuple(int(p) for p in self._split()) if self._numeric else None
 
         def is_numeric(self) -> bool:
-            return re.match(r"^v?[0-9]+(\.[0-9]+)*$", self._raw) is not None
+            return self._numeric
 
         def was_prefixed(self) -> bool:
             return self.is_numeric() and self._raw.startswith("v")
@@ -57,7 +63,7 @@ def _main():
         def to_numeric_tuple(self) -> tuple[int,...]:
             if not self.is_numeric():
                 raise ValueError("Version must be numeric.")
-            return tuple(int(p) for p in self._split())
+            return self._numeric_tuple
 
         def incremented(self) -> "Version":
             if not self.is_numeric():
@@ -106,6 +112,14 @@ def _main():
         print("❌ This does not look like a Python project root (missing .git folder and/or pyproject.toml file).")
         exit()
 
+    # Only now that we know there is work to do, import the rest. (This keeps --help and the above error fast.)
+    import shutil
+    import subprocess
+    try:  # tomli ships compiled wheels and has the same API as the pure-Python tomllib it was upstreamed as.
+        import tomli as tomllib
+    except ImportError:
+        import tomllib
+
     # Inspect the package for its name and version.
     # - The TOML definitely exists. Question is whether it is correctly formed.
     def parse_toml() -> dict:
@@ -117,21 +131,22 @@ def _main():
             exit()
             raise  # Will never be reached, but needed to keep the type checker happy.
 
+    TOML = parse_toml()  # Parsed once. Everything below reads from this rather than reopening the file.
+
     def get_toml_name() -> str:
         try:
-            return parse_toml()["project"]["name"]
+            return TOML["project"]["name"]
         except:
             print("❌ Missing project name in TOML.")
             exit()
             raise  # See parse_toml()
 
     def get_toml_version() -> Optional[Version]:
-        toml = parse_toml()
         try:
-            return Version(toml["project"]["version"])
+            return Version(TOML["project"]["version"])
         except:
             try:
-                if "version" in toml["project"]["dynamic"]:
+                if "version" in TOML["project"]["dynamic"]:
                     return None
                 else:
                     raise
@@ -147,21 +162,18 @@ def _main():
         return subprocess.check_output(tokens, text=True, stderr=subprocess.DEVNULL if silence_errors else None).strip()
 
     def find_toml_changes(field: str) -> list[tuple[str,str]]:
-        separator_pattern = re.compile(r"commit ([a-f0-9]+)")
-        commit_hash_pattern = re.compile(r"[a-f0-9]+")
-        field_changed_pattern = re.compile(r'''\n\+''' + re.escape(field) + r'''\s*=\s*"(.+?)"''')
+        # Single pass over the log: commit headers set the current commit, and the first added line assigning the field
+        # is attributed to it. Passing -G lets Git skip the commits that never touched that line in the first place.
+        pattern = re.compile(r'''^commit ([a-f0-9]+)|^\+''' + re.escape(field) + r'''\s*=\s*"(.+?)"''', re.MULTILINE)
 
         commit_with_field = []
         current_commit = None
-        for commit_or_diff in separator_pattern.split(run_with_output("git", "log", "-p", "--", "pyproject.toml")):
-            if commit_hash_pattern.match(commit_or_diff):
-                current_commit = commit_or_diff
-                continue
-            else:
-                match = field_changed_pattern.search(commit_or_diff)
-                if match:
-                    assert current_commit is not None
-                    commit_with_field.append((current_commit, match.group(1)))
+        for match in pattern.finditer(run_with_output("git", "log", "-p", "-G", f"^{field}[[:space:]]*=", "--", "pyproject.toml")):
+            if match.group(1):
+                current_commit = match.group(1)
+            elif current_commit is not None:
+                commit_with_field.append((current_commit, match.group(2)))
+                current_commit = None  # Any further matches in the same diff are ignored.
         commit_with_field.reverse()
         return commit_with_field
 
@@ -171,29 +183,28 @@ def _main():
 
     # - And even with a project name, can we find the source code?
     def get_package_path() -> Path:
-        with open(PATH_TOML, "rb") as handle:
-            try:  # This is most specific and hence has precedent.
-                package = Path(tomllib.load(handle)["tool"]["hatch"]["build"]["targets"]["wheel"]["packages"][0])
-            except:
-                # If there is a ./src/, it is always investigated.
-                parent_of_package = Path("./src/")
-                if not parent_of_package.is_dir():
-                    parent_of_package = parent_of_package.parent
-
-                # Now, if there is a folder here with the same name as the distribution, that has to be it.
-                _, subfolders, _ = next(os.walk(parent_of_package))
-                subfolders = [f for f in subfolders
-                              if not f.startswith(".") and not f.startswith("_") and not f.endswith(".egg-info")
-                              and f not in {"doc", "docs", "examples", "scripts", "tests", "test", "tst", "notebooks", "docker"}]
-
-                if DISTRIBUTION_NAME in subfolders:
-                    package = parent_of_package / DISTRIBUTION_NAME
-                # Or, if there is only one subfolder, that's likely it.
-                elif len(subfolders) == 1:
-                    package = parent_of_package / subfolders[0]
-                else:
-                    print("❌ Could not find package name.")
-                    exit()
+        try:  # This is most specific and hence has precedent.
+            package = Path(TOML["tool"]["hatch"]["build"]["targets"]["wheel"]["packages"][0])
+        except:
+            # If there is a ./src/, it is always investigated.
+            parent_of_package = Path("./src/")
+            if not parent_of_package.is_dir():
+                parent_of_package = parent_of_package.parent
+
+            # Now, if there is a folder here with the same name as the distribution, that has to be it.
+            with os.scandir(parent_of_package) as entries:  # Only one level is needed, so no os.walk().
+                subfolders = [e.name for e in entries if e.is_dir()
+                              and not e.name.startswith(".") and not e.name.startswith("_") and not e.name.endswith(".egg-info")
+                              and e.name not in {"doc", "docs", "examples", "scripts", "tests", "test", "tst", "notebooks", "docker"}]
+
+            if DISTRIBUTION_NAME in subfolders:
+                package = parent_of_package / DISTRIBUTION_NAME
+            # Or, if there is only one subfolder, that's likely it.
+            elif len(subfolders) == 1:
+                package = parent_of_package / subfolders[0]
+            else:
+                print("❌ Could not find package name.")
+                exit()
 
         # Verify that this folder contains an __init__.py as a sanity check that it is actually a Python module.
         if not (package / "__init__.py").is_file():
@@ -288,18 +299,18 @@ def _main():
             to_ref = to_ref or ""
             range_spec = f"{from_ref}..{to_ref}"
 
-        sep = "<<END>>"
-        log = run_with_output("git", "log", range_spec, f"--pretty=format:%B{sep}")
+        # Only the subjects are needed, and -z separates them by NUL characters, which cannot appear in a commit message.
+        log = run_with_output("git", "log", range_spec, "--pretty=format:%s", "-z")
         if not log:
             return ""
 
-        commit_titles = [s.strip().split("\n")[0] for s in log.split(sep)]
+        commit_titles = [s.strip() for s in log.split("\0")]
         commit_titles.reverse()
         return "".join("- " + title + "\n"
                        for title in commit_titles if title and not title.startswith(COMMIT_PREFIX))
 
     def quote(s: str) -> str:
-        return "\n".join("   | " + line for line in [""] + s.strip().split("\n") + [""])
+        return "   | \n" + "".join("   | " + line + "\n" for line in s.strip().split("\n")) + "   | "
 
     def validate_gh_install():
         """
@@ -332,23 +343,29 @@ def _main():
 
         :return: list of all past releases.
         """
-        ordered_commits_all = [c for c in run_with_output("git", "log", "--format=%H").split("\n") if c]
-        ordered_commits_all.reverse()
-
-        # Get existing tags (this includes tags that are not version changes)
-        c2t: dict[str,Version] = {run_with_output("git", "rev-list", "-1", t): Version(t)
-                                  for t in [t for t in run_with_output("git", "tag", "-l").split("\n") if t]}  # Commits to tags
+        # Get existing tags (this includes tags that are not version changes). One 'git for-each-ref' call resolves all tags
+        # at once, rather than one 'git rev-list' per tag. %(*objectname) is the commit an annotated tag points to, and is
+        # empty for lightweight tags, whose %(objectname) is already the commit. So the first hash on each line is the commit.
+        c2t: dict[str,Version] = dict()  # Commits to tags
+        for line in run_with_output("git", "for-each-ref", "--format=%(*objectname) %(objectname) %(refname:strip=2)", "refs/tags").split("\n"):
+            if not line:
+                continue
+            *hashes, tag = line.split()  # Tag names cannot contain spaces.
+            c2t[hashes[0]] = Version(tag)
 
-        # Get commits with version changes (this includes ReleaseMe tags)
+        # Get commits with version changes (this includes ReleaseMe tags). These come out of 'git log' from old to new, so
+        # there is no need to list (and decode) every hash in the history just to put them in order.
         c2v: dict[str,Version] = dict()  # Commits to TOML versions
         for commit, version in find_toml_changes("version"):
             c2v[commit] = Version(version)
 
-        ordered_commits_versioned = [c for c in ordered_commits_all if c in c2v]
-        ordered_commits_releases  = [c for c in ordered_commits_all if c in c2t and c in c2v and c2t[c] == c2v[c]]
+        ordered_commits_versioned = list(c2v)
+        ordered_commits_releases  = [c for c in ordered_commits_versioned if c in c2t and c2t[c] == c2v[c]]
+        set_of_release_commits = set(ordered_commits_releases)
         set_of_releases   = set(c2v[c] for c in ordered_commits_releases)  # Not the same as the intersection of tags and versions (and also, having a release version doesn't make you a release necessarily, but then we would have to check PyPI).
 
-        last_release_index = ordered_commits_versioned.index(ordered_commits_releases[-1]) if ordered_commits_releases else None
+        index_of_versioned = {c: i for i, c in enumerate(ordered_commits_versioned)}
+        last_release_index = index_of_versioned[ordered_commits_releases[-1]] if ordered_commits_releases else None
         if last_release_index is None:  # Retroactive releases require at least one release.
             if backwards:
                 print(f"❌ No latest release found to look back from, so no backfilling needed!")
@@ -363,7 +380,8 @@ def _main():
         #   2. already tagged (but incorrectly, i.e. different from the TOML) OR
         #   3. numerically not in between their surrounding releases OR
         #   4. out of order within the unofficial versions.
-        commits_to_ignore = []
+        commits_to_ignore: set[str] = set()
+        commits_to_keep: list[str] = []  # Same order as ordered_commits_versioned, so it can replace it without another filtering pass.
         versions_to_add = set()  # This is only a temporary set to track which version names have been used already. The actual updates require knowing ranges of commits, not just a version name.
 
         current_upper_index = 0 if backwards else len(ordered_commits_releases) - 1 if ordered_commits_releases else 0
@@ -371,46 +389,48 @@ def _main():
         for candidate_commit in ordered_commits_versioned:
             candidate_version = c2v[candidate_commit]
 
-            if candidate_commit in ordered_commits_releases:  # This is an actual release.
+            if candidate_commit in set_of_release_commits:  # This is an actual release.
                 current_upper_index += 1
                 predecessor_commit = candidate_commit
+                commits_to_keep.append(candidate_commit)
                 continue
 
             # Test 1: Aliasing an existing release.
             if candidate_version in set_of_releases:
-                commits_to_ignore.append(candidate_commit)
+                commits_to_ignore.add(candidate_commit)
                 continue
             elif candidate_version in versions_to_add:
-                commits_to_ignore.append(candidate_commit)
+                commits_to_ignore.add(candidate_commit)
                 continue
 
             # Test 2: Already tagged.
             if candidate_commit in c2t:
                 assert c2v[candidate_commit] != c2t[candidate_commit]
-                commits_to_ignore.append(candidate_commit)
+                commits_to_ignore.add(candidate_commit)
                 continue
 
             # Test 3a: Lower than the previous release.
             if current_upper_index > 0:
                 lower_version = c2v[ordered_commits_releases[current_upper_index - 1]]
                 if candidate_version < lower_version:  # TODO: Don't do this check if the version is not numeric.
-                    commits_to_ignore.append(candidate_commit)
+                    commits_to_ignore.add(candidate_commit)
                     continue
 
             # Test 3b: Higher than the next release.
             if current_upper_index < len(ordered_commits_releases):
                 upper_version = c2v[ordered_commits_releases[current_upper_index]]
                 if upper_version < candidate_version:
-                    commits_to_ignore.append(candidate_commit)
+                    commits_to_ignore.add(candidate_commit)
                     continue
 
             # Test 4: Lower than the preceding version (official or unofficial release).
             if predecessor_commit is not None:
                 if candidate_version < c2v[predecessor_commit]:
-                    commits_to_ignore.append(candidate_commit)
+                    commits_to_ignore.add(candidate_commit)
                     continue
 
             predecessor_commit = candidate_commit
+            commits_to_keep.append(candidate_commit)
             versions_to_add.add(candidate_version)
 
         ### Debug prints:
@@ -418,7 +438,7 @@ def _main():
         # print("TOML versions ignored for various reasons:", sorted(map(c2v.get, commits_to_ignore)))
         # print("Tags ignored due to lack of matching TOML version:", sorted(set(c2t.values()) - versions_to_add - set_of_releases))
         ###
-        ordered_commits_versioned = [c for c in ordered_commits_versioned if c not in commits_to_ignore]
+        ordered_commits_versioned = commits_to_keep
 
         # Now that we know all commits with a valid version change, pair them up in commit ranges, but only keep the ranges that end in a non-existing release.
         update_ranges: list[tuple[str,Version,str,Version]] = []
@@ -439,9 +459,16 @@ def _main():
             new_versions = [end for _, start, _, end in update_ranges]
 
             if backwards or user_says_yes("   Would you like to release these separately first?", default_no=last_release_index is not None):
+                # Release notes are generated once per range, whether they are previewed, released, or both. Each range needs
+                # its own 'git log' process and they don't depend on each other, so they are all run concurrently.
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=min(8, len(update_ranges))) as executor:
+                    all_notes = list(executor.map(lambda r: generate_release_notes(r[0], r[2]), update_ranges))
+                notes_by_range: dict[tuple[str,str],str] = {(start_commit, end_commit): notes for (start_commit, _, end_commit, _), notes in zip(update_ranges, all_notes)}
+
                 if user_says_yes("   Would you like to check their release notes?", default_no=False):
                     for start_commit, _, end_commit, version in update_ranges:
-                        notes = generate_release_notes(start_commit, end_commit)
+                        notes = notes_by_range[(start_commit, end_commit)]
                         print(f"✅ Generated release notes for {version.to_formatted()}:")
                         print(quote(notes))
 
@@ -458,7 +485,7 @@ def _main():
                     validate_gh_install()
                     for i, (start_commit, _, end_commit, version) in enumerate(update_ranges):
                         version_name = version.to_formatted()
-                        notes = generate_release_notes(start_commit, end_commit)  # yeah yeah double work boohoo CPU
+                        notes = notes_by_range[(start_commit, end_commit)]
 
                         # Within Git, the below "committer date" works to pretend the tag was there at the time of the commit.
                         #   - PyPI registers the time of release rather than the (fake) time of the tag, but interestingly,
@@ -480,8 +507,28 @@ def _main():
 
         return [c2t[c] for c in ordered_commits_releases]
 
-    releases = find_toml_releases(do_backfill)
-    latest_release_tag = releases[-1] if releases else None
+    def find_latest_release() -> Optional[Version]:
+        """
+        Fast alternative to find_toml_releases() for normal releases: rather than going through the entire history, take
+        the most recent tag reachable from HEAD and accept it as the latest release if the TOML at that tag agrees with it.
+
+        :return: the tag of the latest release, or None if it could not be identified this way.
+        """
+        try:
+            tag = Version(run_with_output("git", "describe", "--tags", "--abbrev=0", silence_errors=True))
+            toml_at_tag = tomllib.loads(run_with_output("git", "show", f"{tag.to_original()}:pyproject.toml", silence_errors=True))
+            if Version(toml_at_tag["project"]["version"]) != tag:
+                return None
+        except:
+            return None
+
+        print(f"✅ Latest release was {tag.to_original()}.")
+        return tag
+
+    latest_release_tag = find_latest_release() if not do_backfill and not args.check_retro else None
+    if latest_release_tag is None:  # Either we need the full history anyway, or the quick way didn't work.
+        releases = find_toml_releases(do_backfill)
+        latest_release_tag = releases[-1] if releases else None
 
     # Now comes everything after retroactive versioning.
     def end():
@@ -540,21 +587,24 @@ def _main():
         print(quote(notes))
 
         # Update all mentions of the version in the project files. TODO: Could expand this to ALL files in the repo. Search for the old version and replace it.
+        #   - Both files are edited as bytes: no decoding/encoding round trip, and line endings are left exactly as they were.
+        #   - Only the first match is replaced. For the TOML, the match must start a line, so e.g. target-version is not touched.
+        PATTERN_TOML_VERSION = re.compile(rb"""^version\s*=\s*["'][0-9a-zA-Z.\-+]+["']""", re.MULTILINE)
         def update_pyproject(version_name: str):
-            content = PATH_TOML.read_text()
-            new_content = re.sub(r"""version\s*=\s*["'][0-9a-zA-Z.\-+]+["']""", f'version = "{version_name}"', content)
-            PATH_TOML.write_text(new_content)
+            content = PATH_TOML.read_bytes()
+            new_content = PATTERN_TOML_VERSION.sub(f'version = "{version_name}"'.encode(), content, count=1)
+            PATH_TOML.write_bytes(new_content)
             print(f"✅ Updated pyproject.toml to version {version_name}")
 
-        PATH_VARIABLE = args.runtime_variable_path or get_package_path() / "__init__.py"
+        PATH_VARIABLE    = args.runtime_variable_path or get_package_path() / "__init__.py"
+        PATTERN_VARIABLE = re.compile(re.escape(args.runtime_variable_name).encode() + rb"""\s*=\s*["'][0-9a-zA-Z.\-+]+["']""")
         def update_variable(version_name: str):
             if not PATH_VARIABLE.exists():
                 print(f"⚠️ {PATH_VARIABLE.name} not found; skipping {args.runtime_variable_name} update")
                 return
-            content = PATH_VARIABLE.read_text()
-            new_content = re.sub(re.escape(args.runtime_variable_name) + r"""\s*=\s*["'][0-9a-zA-Z.\-+]+["']""",
-                                 f'{args.runtime_variable_name} = "{version_name}"', content)
-            PATH_VARIABLE.write_text(new_content)
+            content = PATH_VARIABLE.read_bytes()
+            new_content = PATTERN_VARIABLE.sub(f'{args.runtime_variable_name} = "{version_name}"'.encode(), content, count=1)
+            PATH_VARIABLE.write_bytes(new_content)
             print(f"✅ Updated {PATH_VARIABLE.name} to version {version_name}")
 
         # Save changes with Git.
@@ -564,8 +614,7 @@ def _main():
                 run("git", "add", "pyproject.toml", PATH_VARIABLE.as_posix())  #, stderr=subprocess.STDOUT)
                 run("git", "commit", "-m", f"🔖 Release {version_name}\n\n{notes}")
                 run("git", "tag", "-a", version_name, "-m", f"Release {version_name}\n\n{notes}")
-                run("git", "push",                         silence_output=True)
-                run("git", "push", "origin", version_name, silence_output=True)
+                run("git", "push", "--atomic", "origin", "HEAD", f"refs/tags/{version_name}", silence_output=True)  # Branch and tag in one round trip, and either both or neither arrive.
                 run("gh", "workflow", "run", WORKFLOW_NAME, "-f", f"tag={version_name}", "-f", f"project={DISTRIBUTION_NAME}", silence_output=True)
                 print("="*50)
             except: